@@ -1,17 +1,34 @@
 from typing import TypedDict, List
 import os
+import hashlib
 from langgraph.graph import StateGraph, END
 from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.globals import set_llm_cache, get_llm_cache
+from langchain_core.outputs import Generation
+from langchain_core.runnables import RunnableConfig
+from langchain_community.cache import SQLiteCache
 from app.core.rag_engine import RAGEngine
 
 class AgentState(TypedDict):
     question: str
     documents: List[str]
+    scores: List[float]
     answer: str
+    answer_cached: bool
     run_web_search: bool
 
 rag = RAGEngine()
 
+# Cache LLM completions so repeated prompts skip the Gemini round trip.
+# Use Redis when several workers need to share the cache.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    import redis
+    from langchain_community.cache import RedisCache
+    set_llm_cache(RedisCache(redis_=redis.Redis.from_url(REDIS_URL)))
+else:
+    set_llm_cache(SQLiteCache(database_path=os.getenv("LLM_CACHE_PATH", ".langchain_cache.db")))
+
 # Using Google Gemini 2.0 for cloud deployment
 llm = ChatGoogleGenerativeAI(
     model="gemini-2.0-flash",
@@ -19,29 +36,52 @@ llm = ChatGoogleGenerativeAI(
     google_api_key=os.getenv("GOOGLE_API_KEY"),
 )
 
-def invoke_llm(llm, prompt: str) -> str:
-    """Invoke LLM with Gemini 2.0"""
-    response = llm.invoke(prompt)
-    return response.content
-
-def retrieve_node(state: AgentState):
-    docs = rag.get_retriever().invoke(state["question"])
-    return {"documents": [d.page_content for d in docs], "run_web_search": False}
+GRADE_MAX_CONCURRENCY = 8
+RETRIEVE_K = 5
+RELEVANCE_THRESHOLD = 0.5
+
+# astream never consults the global LLM cache, so generated answers are cached
+# explicitly under this key alongside the prompt
+ANSWER_CACHE_KEY = f"generate:{llm.model}:{llm.temperature}"
+
+async def retrieve_node(state: AgentState):
+    results = await rag.get_vector_db().asimilarity_search_with_relevance_scores(state["question"], k=RETRIEVE_K)
+
+    # Drop repeated chunk text (e.g. the same PDF ingested twice) so it is neither graded nor sent to Gemini twice
+    documents, scores, seen = [], [], set()
+    for doc, score in results:
+        digest = hashlib.blake2b(doc.page_content.encode("utf-8"), digest_size=16).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        documents.append(doc.page_content)
+        scores.append(score)
+
+    return {"documents": documents, "scores": scores, "run_web_search": False}
+
+async def grade_with_llm(question: str, documents: List[str]) -> List[str]:
+    """Ask Gemini to grade documents the embedding scores could not vouch for"""
+    prompts = [
+        f"Is this document relevant to: {question}? Answer only 'yes' or 'no'.\nDoc: {doc}"
+        for doc in documents
+    ]
+    try:
+        # Grade every document in one concurrent batch instead of one round trip per doc
+        responses = await llm.abatch(prompts, config={"max_concurrency": GRADE_MAX_CONCURRENCY})
+        return [doc for doc, res in zip(documents, responses) if "yes" in res.content.lower()]
+    except Exception as e:
+        print(f"Error grading documents: {e}")
+        return list(documents)
 
-def grade_documents_node(state: AgentState):
+async def grade_documents_node(state: AgentState):
     documents = state["documents"]
-    filtered_docs = []
+    scores = state.get("scores") or []
     search = False
-    
-    for doc in documents:
-        prompt = f"Is this document relevant to: {state['question']}? Answer only 'yes' or 'no'.\nDoc: {doc}"
-        try:
-            res = invoke_llm(llm, prompt)
-            if "yes" in res.lower():
-                filtered_docs.append(doc)
-        except Exception as e:
-            print(f"Error grading document: {e}")
-            filtered_docs.append(doc)
+
+    # Trust the embedding similarity first; only fall back to the LLM grader when nothing clears the bar
+    filtered_docs = [doc for doc, score in zip(documents, scores) if score >= RELEVANCE_THRESHOLD]
+    if not filtered_docs and documents:
+        filtered_docs = await grade_with_llm(state["question"], documents)
     
     if not filtered_docs:
         search = True
@@ -49,14 +89,25 @@ def grade_documents_node(state: AgentState):
     return {"documents": filtered_docs}
 
 
-def generative_node(state: AgentState):
+async def generative_node(state: AgentState, config: RunnableConfig):
     if state.get("answer"):
         return state
 
     context = "\n\n".join(state["documents"])
     prompt = f"Based on the following context, answer the question.\n\nContext: {context}\n\nQuestion: {state['question']}\n\nAnswer:"
+    cache = get_llm_cache()
     try:
-        response_content = invoke_llm(llm, prompt)
+        cached = await cache.alookup(prompt, ANSWER_CACHE_KEY) if cache else None
+        if cached:
+            # No tokens are streamed on a hit; the websocket sends the whole answer as one chunk
+            return {"answer": cached[0].text, "answer_cached": True}
+
+        # Stream so astream_events emits on_chat_model_stream tokens as Gemini produces them
+        response_content = ""
+        async for chunk in llm.astream(prompt, config=config):
+            response_content += chunk.content
+        if cache and response_content:
+            await cache.aupdate(prompt, ANSWER_CACHE_KEY, [Generation(text=response_content)])
         return {"answer": response_content}
     except Exception as e:
         return {"answer": f"Error: {str(e)}"}
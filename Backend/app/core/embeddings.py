@@ -0,0 +1,90 @@
+import os
+from functools import lru_cache
+from typing import List
+import numpy as np
+import torch
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+# "huggingface" runs the FP32 PyTorch model; "onnx" serves an int8-quantized export through ONNX Runtime
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "huggingface")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "./onnx_minilm")
+
+# Quantized vectors differ slightly from FP32 ones, so each backend keeps its own embedding cache
+EMBEDDING_CACHE_NAMESPACE = "minilm-l6-v2-onnx-int8" if EMBEDDINGS_BACKEND == "onnx" else "minilm-l6-v2"
+
+# Explicit HNSW settings, applied when the collection is first created. Embeddings are
+# L2-normalized, so cosine distance ranks the same as a plain dot product.
+CHROMA_COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32,
+    "hnsw:search_ef": 64,
+}
+
+class QuantizedMiniLMEmbeddings(Embeddings):
+    """MiniLM exported to ONNX with dynamic int8 quantization, served by ONNX Runtime"""
+
+    QUANTIZED_FILE = "model_quantized.onnx"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, model_dir: str = ONNX_MODEL_DIR, batch_size: int = 128):
+        if not os.path.exists(os.path.join(model_dir, self.QUANTIZED_FILE)):
+            # One-off export and quantization; later starts load the saved int8 model directly
+            print(f"Exporting {model_name} to ONNX and quantizing to int8...")
+            ORTModelForFeatureExtraction.from_pretrained(model_name, export=True).save_pretrained(model_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+            ORTQuantizer.from_pretrained(model_dir).quantize(
+                quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False),
+                save_dir=model_dir
+            )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_dir, file_name=self.QUANTIZED_FILE)
+        self.batch_size = batch_size
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=256,
+                return_tensors="np"
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            # Mean-pool over real tokens and L2-normalize, matching the sentence-transformers pipeline
+            mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+@lru_cache(maxsize=1)
+def get_embeddings():
+    """Return the process-wide MiniLM embedder so the model weights are loaded only once"""
+    if EMBEDDINGS_BACKEND == "onnx":
+        if not ONNX_AVAILABLE:
+            raise ValueError("ONNX embeddings requested but optimum is not installed. Please install optimum[onnxruntime].")
+        return QuantizedMiniLMEmbeddings()
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs={"device": DEVICE},
+        encode_kwargs={"batch_size": 128, "normalize_embeddings": True}
+    )
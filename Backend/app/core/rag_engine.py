@@ -1,16 +1,19 @@
 import os
 import time
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from langchain_classic.embeddings import CacheBackedEmbeddings
+from langchain_classic.storage import LocalFileStore
+from app.core.embeddings import get_embeddings, EMBEDDING_CACHE_NAMESPACE, CHROMA_COLLECTION_METADATA
 
 
 try:
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
     import pytesseract
     from PIL import Image
     OCR_AVAILABLE = True
@@ -19,13 +22,61 @@ except ImportError:
 
 load_dotenv()
 
+# 200 DPI is plenty for typed scans and has ~2.25x fewer pixels than 300 DPI;
+# LSTM-only engine with a single-block layout skips the legacy recognizer pass
+OCR_DPI = 200
+TESSERACT_CONFIG = "--oem 1 --psm 6"
+# Pages are OCR'd in parallel, one tesseract process each; stop every process also
+# spawning an OpenMP thread per core (pytesseract's subprocesses inherit this)
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+def _ocr_page_image(image_path: str) -> str:
+    """OCR a rendered page image, then delete it so temp disk use tracks the pages in flight"""
+    try:
+        return pytesseract.image_to_string(image_path, lang="eng", config=TESSERACT_CONFIG)
+    finally:
+        os.remove(image_path)
+
+# Larger chunks roughly halve the chunk count (and embedding/index work) versus 400/80;
+# the splitter is stateless, so one instance is shared across ingests
+_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=1000,
+    chunk_overlap=150,
+    length_function=len,
+    separators=["\n\n\n", "\n\n", "\n", ". ", " ", ""]
+)
+
+# Chunks embedded and upserted per Chroma write; bounds peak memory on large PDFs
+INGEST_BATCH_SIZE = 256
+
 class RAGEngine:
     def __init__(self):
       
-        self.embedding = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
+        # Reuse vectors for chunk text we have already embedded (re-uploads, repeated boilerplate)
+        self.embedding = CacheBackedEmbeddings.from_bytes_store(
+            get_embeddings(),
+            LocalFileStore("./emb_cache"),
+            namespace=EMBEDDING_CACHE_NAMESPACE,
+            key_encoder="sha256"
         )
         self.persist_directory = "./chroma_db"
+        # Open the collection once; every query and ingest reuses the same handle
+        self._vector_db = Chroma(
+            persist_directory=self.persist_directory,
+            embedding_function=self.embedding,
+            collection_metadata=CHROMA_COLLECTION_METADATA
+        )
+        # HNSW settings only apply to new collections; an older chroma_db may still use l2
+        hnsw_space = (self._vector_db._collection.configuration.get("hnsw") or {}).get("space")
+        # Relevance is cosine similarity clamped to [0, 1] either way, so one threshold fits both
+        if hnsw_space == "cosine":
+            self._vector_db.override_relevance_score_fn = lambda distance: max(0.0, 1.0 - distance)
+        else:
+            print(f"Warning: Chroma collection in {self.persist_directory} uses '{hnsw_space}' distance, not cosine. "
+                  "Delete it and re-ingest your PDFs to rebuild the index.")
+            if hnsw_space == "l2":
+                # Chroma reports squared L2; for normalized embeddings cosine similarity is 1 - d/2
+                self._vector_db.override_relevance_score_fn = lambda distance: max(0.0, 1.0 - distance / 2)
         if OCR_AVAILABLE:
             possible_paths = [
                 r"C:\Program Files\Tesseract-OCR\tesseract.exe",
@@ -59,14 +110,32 @@ class RAGEngine:
                     poppler_path = path
                     break
             
-            if poppler_path:
-                images = convert_from_path(file_path, dpi=300, poppler_path=poppler_path)
-            else:
-                images = convert_from_path(file_path, dpi=300)
+            page_count = pdfinfo_from_path(file_path, poppler_path=poppler_path)["Pages"]
+            
+            # Rasterize one page at a time to disk and hand each file straight to an OCR worker,
+            # so Poppler and Tesseract overlap and only in-flight pages are held at once
+            workers = os.cpu_count() or 1
+            with tempfile.TemporaryDirectory() as image_dir, ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = []
+                for page in range(1, page_count + 1):
+                    # Don't let Poppler run far ahead of OCR; wait once a couple of pages per worker are queued
+                    if len(futures) >= 2 * workers:
+                        futures[-2 * workers].result()
+                    image_paths = convert_from_path(
+                        file_path,
+                        dpi=OCR_DPI,
+                        poppler_path=poppler_path,
+                        first_page=page,
+                        last_page=page,
+                        output_folder=image_dir,
+                        fmt="jpeg",
+                        grayscale=True,
+                        paths_only=True
+                    )
+                    futures.extend(executor.submit(_ocr_page_image, path) for path in image_paths)
+                texts = [future.result() for future in futures]
             
-            for i, image in enumerate(images):
-                text = pytesseract.image_to_string(image)
-                
+            for i, text in enumerate(texts):
                 if text.strip():
                     documents.append(Document(
                         page_content=text,
@@ -98,35 +167,24 @@ class RAGEngine:
         if not text_documents:
             raise ValueError("Could not extract any text from PDF (tried both regular extraction and OCR)")
 
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=400, 
-            chunk_overlap=80,
-            length_function=len,
-            separators=["\n\n\n", "\n\n", "\n", ". ", " ", ""]
-        )
-        chunks = text_splitter.split_documents(text_documents)
+        chunks = _SPLITTER.split_documents(text_documents)
         
         if not chunks:
             raise ValueError("Could not extract any text chunks from the PDF")
         
+        # Length-sort so each embedding batch pads to similar sequence lengths;
+        # metadata travels with each Document, so ordering is otherwise irrelevant
+        chunks.sort(key=lambda c: len(c.page_content))
+        
         print(f"Starting local ingestion for {len(chunks)} chunks...")
         
-        vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=self.embedding,
-            persist_directory=self.persist_directory
-        )
+        for start in range(0, len(chunks), INGEST_BATCH_SIZE):
+            batch = chunks[start:start + INGEST_BATCH_SIZE]
+            self._vector_db.add_documents(batch)
+            print(f"Indexed {start + len(batch)}/{len(chunks)} chunks")
         
         print(f"Successfully indexed {len(chunks)} chunks locally.")
         return f"Successfully processed {len(chunks)} text chunks"
     
-    def get_retriever(self):
-        vector_db = Chroma(
-            persist_directory=self.persist_directory,
-            embedding_function=self.embedding
-        )
-        
-        return vector_db.as_retriever(
-            search_type="mmr",
-            search_kwargs={"k": 1, "fetch_k": 5} 
-        )
\ No newline at end of file
+    def get_vector_db(self):
+        return self._vector_db
\ No newline at end of file
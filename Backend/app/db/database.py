@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text, DateTime
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 from .models import Base
@@ -10,14 +10,38 @@ DATABASE_URL = os.getenv(
 )
 
 
-engine = create_engine(DATABASE_URL, echo=False)
+# Sized for concurrent HTTP and websocket handlers; pre_ping/recycle drop connections the server has closed
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    pool_size=20,
+    max_overflow=40,
+    pool_pre_ping=True,
+    pool_recycle=1800
+)
 
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay usable after commit without a reload SELECT; handlers refresh explicitly when they need DB-generated values
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add any indexes declared since they were created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    # Timestamps are stamped by Postgres; give columns created before that the same DEFAULT now().
+    # Only columns still missing a default are altered, so normal startups take no table locks.
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            inspector = inspect(conn)
+            for table in Base.metadata.sorted_tables:
+                existing_defaults = {col["name"]: col["default"] for col in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if (isinstance(column.type, DateTime) and column.server_default is not None
+                            and existing_defaults.get(column.name) is None):
+                        conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} SET DEFAULT now()"))
     print("Database tables created successfully!")
 
 def get_db():
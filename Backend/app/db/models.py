@@ -1,6 +1,5 @@
-from datetime import datetime
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, Index, select, func
+from sqlalchemy.orm import relationship, declarative_base, column_property
 import uuid
 
 Base = declarative_base()
@@ -10,13 +9,17 @@ def generate_uuid():
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conv_updated_at", "updated_at"),
+    )
     
     id = Column(String(36), primary_key=True, default=generate_uuid)
     title = Column(String(255), default="New Chat")
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", order_by="Message.created_at")
+    # lazy="raise" flags accidental full loads; query messages explicitly and let the DB cascade deletes
+    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", order_by="Message.created_at", lazy="raise", passive_deletes=True)
     
     def to_dict(self):
         return {
@@ -24,17 +27,20 @@ class Conversation(Base):
             "title": self.title,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-            "message_count": len(self.messages) if self.messages else 0
+            "message_count": self.message_count or 0
         }
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_msg_conv_created", "conversation_id", "created_at"),
+    )
     
     id = Column(String(36), primary_key=True, default=generate_uuid)
     conversation_id = Column(String(36), ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
     role = Column(String(20), nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     conversation = relationship("Conversation", back_populates="messages")
     
@@ -46,6 +52,15 @@ class Message(Base):
             "timestamp": self.created_at.isoformat() if self.created_at else None
         }
 
+# Counted in SQL instead of loading the messages; deferred so only queries that undefer it pay for the count
+Conversation.message_count = column_property(
+    select(func.count())
+    .where(Message.conversation_id == Conversation.id)
+    .correlate_except(Message)
+    .scalar_subquery(),
+    deferred=True
+)
+
 class Document(Base):
     __tablename__ = "documents"
     
@@ -54,7 +69,7 @@ class Document(Base):
     file_path = Column(String(500), nullable=False)
     file_size = Column(Integer)
     chunk_count = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     def to_dict(self):
         return {
@@ -1,6 +1,6 @@
 import os
 from langchain_chroma import Chroma 
-from langchain_huggingface import HuggingFaceEmbeddings # Updated for 2025 standard
+from app.core.embeddings import get_embeddings, CHROMA_COLLECTION_METADATA
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,15 +17,14 @@ def get_vector_store():
     This ensures enterprise-standard data persistence without API rate limits.
     """
 
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
+    embeddings = get_embeddings()
     
     db_path = get_db_path()
     
     vector_db = Chroma(
         persist_directory=db_path,
-        embedding_function=embeddings
+        embedding_function=embeddings,
+        collection_metadata=CHROMA_COLLECTION_METADATA
     )
     
     return vector_db
\ No newline at end of file
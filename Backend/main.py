@@ -4,20 +4,19 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
-from app.agents.graph import agent_graph
-from app.core.rag_engine import RAGEngine
-from app.db.database import init_db, get_db_session
+from sqlalchemy.orm import Session, undefer
+from app.agents.graph import agent_graph, rag as rag_engine
+from app.db.database import init_db, get_db, get_db_session
 from app.db.models import Conversation, Message, Document
 import tempfile
 
 app = FastAPI()
 
-rag_engine = RAGEngine()
-
 # Initialize database on startup
 @app.on_event("startup")
 def startup_event():
@@ -49,12 +48,13 @@ async def upload_pdf(file: UploadFile = File(...)):
     try:
         file_path = os.path.join(DATA_FOLDER, file.filename)
         
-        content = await file.read() 
-
+        # Copy in 1 MB pieces so memory stays flat regardless of PDF size
         with open(file_path, "wb") as buffer:
-            buffer.write(content)
+            while chunk := await file.read(1 << 20):
+                buffer.write(chunk)
 
-        result = rag_engine.process_pdf(file_path)
+        # Parsing, OCR and embedding are blocking; keep them off the event loop
+        result = await run_in_threadpool(rag_engine.process_pdf, file_path)
         
         return {
             "status": "success", 
@@ -100,21 +100,17 @@ class MessageCreate(BaseModel):
     content: str
 
 @app.get("/conversations")
-async def list_conversations():
+async def list_conversations(db: Session = Depends(get_db)):
     """List all conversations"""
-    db = get_db_session()
     try:
-        conversations = db.query(Conversation).order_by(Conversation.updated_at.desc()).all()
+        conversations = db.query(Conversation).options(undefer(Conversation.message_count)).order_by(Conversation.updated_at.desc()).all()
         return {"status": "success", "conversations": [c.to_dict() for c in conversations]}
     except Exception as e:
         return {"status": "error", "error": str(e)}
-    finally:
-        db.close()
 
 @app.post("/conversations")
-async def create_conversation(data: ConversationCreate):
+async def create_conversation(data: ConversationCreate, db: Session = Depends(get_db)):
     """Create a new conversation"""
-    db = get_db_session()
     try:
         conversation = Conversation(title=data.title)
         db.add(conversation)
@@ -124,35 +120,30 @@ async def create_conversation(data: ConversationCreate):
     except Exception as e:
         db.rollback()
         return {"status": "error", "error": str(e)}
-    finally:
-        db.close()
 
 @app.get("/conversations/{conversation_id}")
-async def get_conversation(conversation_id: str):
+async def get_conversation(conversation_id: str, db: Session = Depends(get_db)):
     """Get a conversation with its messages"""
-    db = get_db_session()
     try:
-        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        conversation = db.query(Conversation).options(undefer(Conversation.message_count)).filter(Conversation.id == conversation_id).first()
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
+        messages = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.created_at).all()
         return {
             "status": "success",
             "conversation": conversation.to_dict(),
-            "messages": [m.to_dict() for m in conversation.messages]
+            "messages": [m.to_dict() for m in messages]
         }
     except HTTPException:
         raise
     except Exception as e:
         return {"status": "error", "error": str(e)}
-    finally:
-        db.close()
 
 @app.put("/conversations/{conversation_id}")
-async def update_conversation(conversation_id: str, data: ConversationUpdate):
+async def update_conversation(conversation_id: str, data: ConversationUpdate, db: Session = Depends(get_db)):
     """Update conversation title"""
-    db = get_db_session()
     try:
-        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        conversation = db.query(Conversation).options(undefer(Conversation.message_count)).filter(Conversation.id == conversation_id).first()
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
         conversation.title = data.title
@@ -163,13 +154,10 @@ async def update_conversation(conversation_id: str, data: ConversationUpdate):
     except Exception as e:
         db.rollback()
         return {"status": "error", "error": str(e)}
-    finally:
-        db.close()
 
 @app.delete("/conversations/{conversation_id}")
-async def delete_conversation(conversation_id: str):
+async def delete_conversation(conversation_id: str, db: Session = Depends(get_db)):
     """Delete a conversation and all its messages"""
-    db = get_db_session()
     try:
         conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
         if not conversation:
@@ -182,18 +170,16 @@ async def delete_conversation(conversation_id: str):
     except Exception as e:
         db.rollback()
         return {"status": "error", "error": str(e)}
-    finally:
-        db.close()
 
 @app.post("/conversations/{conversation_id}/messages")
-async def add_message(conversation_id: str, data: MessageCreate):
+async def add_message(conversation_id: str, data: MessageCreate, db: Session = Depends(get_db)):
     """Add a message to a conversation"""
-    db = get_db_session()
     try:
         conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
+        is_first_message = not db.query(Message.id).filter(Message.conversation_id == conversation_id).first()
         message = Message(
             conversation_id=conversation_id,
             role=data.role,
@@ -202,7 +188,7 @@ async def add_message(conversation_id: str, data: MessageCreate):
         db.add(message)
         
         # Update conversation title from first user message
-        if data.role == "user" and len(conversation.messages) == 0:
+        if data.role == "user" and is_first_message:
             conversation.title = data.content[:50] + ("..." if len(data.content) > 50 else "")
         
         db.commit()
@@ -213,8 +199,6 @@ async def add_message(conversation_id: str, data: MessageCreate):
     except Exception as e:
         db.rollback()
         return {"status": "error", "error": str(e)}
-    finally:
-        db.close()
 
 # ============== WEBSOCKET WITH CONVERSATION SUPPORT ==============
 
@@ -228,64 +212,73 @@ async def chat_socket(websocket: WebSocket, conversation_id: str):
             query = await websocket.receive_text()
             inputs = {"question": query}
             
-            # Save user message to database
+            # One session for the whole turn: the user message is committed straight away (releasing
+            # the connection while the answer streams) and the same session saves the reply
             db = get_db_session()
             try:
-                conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-                if conversation:
-                    user_msg = Message(conversation_id=conversation_id, role="user", content=query)
-                    db.add(user_msg)
-                    # Update title from first message
-                    if len(conversation.messages) == 0:
-                        conversation.title = query[:50] + ("..." if len(query) > 50 else "")
-                    db.commit()
-            except Exception as db_error:
-                print(f"Error saving user message: {db_error}")
-            finally:
-                db.close()
-            
-            assistant_response = ""
-            
-            try:
-                async for event in agent_graph.astream_events(inputs, version="v1"):
-                    kind = event["event"]
-                    
-                    if kind == "on_chain_start":
-                        await websocket.send_json({"type": "status", "content": "Thinking..."})
-                    
-                    elif kind == "on_chat_model_stream":
-                        content = event["data"]["chunk"].content
-                        if content:
-                            assistant_response += content
-                            await websocket.send_json({"type": "chunk", "content": content})
-
-                await websocket.send_json({"type": "end", "content": ""})
-                
-                # Save assistant response to database
-                if assistant_response:
-                    db = get_db_session()
-                    try:
-                        assistant_msg = Message(conversation_id=conversation_id, role="assistant", content=assistant_response)
-                        db.add(assistant_msg)
+                try:
+                    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+                    if conversation:
+                        is_first_message = not db.query(Message.id).filter(Message.conversation_id == conversation_id).first()
+                        user_msg = Message(conversation_id=conversation_id, role="user", content=query)
+                        db.add(user_msg)
+                        # Update title from first message
+                        if is_first_message:
+                            conversation.title = query[:50] + ("..." if len(query) > 50 else "")
                         db.commit()
-                    except Exception as db_error:
-                        print(f"Error saving assistant message: {db_error}")
-                    finally:
-                        db.close()
+                except Exception as db_error:
+                    db.rollback()
+                    print(f"Error saving user message: {db_error}")
+                
+                assistant_response = ""
+                
+                try:
+                    async for event in agent_graph.astream_events(inputs, version="v1"):
+                        kind = event["event"]
                         
-            except Exception as agent_error:
-                error_msg = str(agent_error)
-                if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                    await websocket.send_json({
-                        "type": "chunk", 
-                        "content": "⚠️ Rate limit reached. Please wait about 60 seconds before asking another question."
-                    })
-                else:
-                    await websocket.send_json({
-                        "type": "chunk",
-                        "content": f"Error processing request: {error_msg}"
-                    })
-                await websocket.send_json({"type": "end", "content": ""})
+                        if kind == "on_chain_start":
+                            await websocket.send_json({"type": "status", "content": "Thinking..."})
+                        
+                        elif kind == "on_chat_model_stream" and event["metadata"].get("langgraph_node") == "generate":
+                            content = event["data"]["chunk"].content
+                            if content:
+                                assistant_response += content
+                                await websocket.send_json({"type": "chunk", "content": content})
+
+                        elif kind == "on_chain_end" and event["name"] == "generate":
+                            output = event["data"].get("output") or {}
+                            if output.get("answer_cached") and not assistant_response:
+                                # Cached answers skip the model, so send them as a single chunk
+                                assistant_response = output["answer"]
+                                await websocket.send_json({"type": "chunk", "content": assistant_response})
+
+                    await websocket.send_json({"type": "end", "content": ""})
+                    
+                    # Save assistant response to database
+                    if assistant_response:
+                        try:
+                            assistant_msg = Message(conversation_id=conversation_id, role="assistant", content=assistant_response)
+                            db.add(assistant_msg)
+                            db.commit()
+                        except Exception as db_error:
+                            db.rollback()
+                            print(f"Error saving assistant message: {db_error}")
+                            
+                except Exception as agent_error:
+                    error_msg = str(agent_error)
+                    if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
+                        await websocket.send_json({
+                            "type": "chunk", 
+                            "content": "⚠️ Rate limit reached. Please wait about 60 seconds before asking another question."
+                        })
+                    else:
+                        await websocket.send_json({
+                            "type": "chunk",
+                            "content": f"Error processing request: {error_msg}"
+                        })
+                    await websocket.send_json({"type": "end", "content": ""})
+            finally:
+                db.close()
 
     except WebSocketDisconnect:
         connection_closed = True
@@ -317,11 +310,16 @@ async def chat_socket_legacy(websocket: WebSocket):
                     if kind == "on_chain_start":
                         await websocket.send_json({"type": "status", "content": "Thinking..."})
                     
-                    elif kind == "on_chat_model_stream":
+                    elif kind == "on_chat_model_stream" and event["metadata"].get("langgraph_node") == "generate":
                         content = event["data"]["chunk"].content
                         if content:
                             await websocket.send_json({"type": "chunk", "content": content})
 
+                    elif kind == "on_chain_end" and event["name"] == "generate":
+                        output = event["data"].get("output") or {}
+                        if output.get("answer_cached"):
+                            await websocket.send_json({"type": "chunk", "content": output["answer"]})
+
                 await websocket.send_json({"type": "end", "content": ""})
             except Exception as agent_error:
                 error_msg = str(agent_error)